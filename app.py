@@ -1,14 +1,19 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
 from langchain_cohere import ChatCohere
 from langchain_community.chat_message_histories.streamlit import (
     StreamlitChatMessageHistory,
 )
+from langchain_core.messages import HumanMessage, SystemMessage, trim_messages
 from langchain_openai import ChatOpenAI
 
-from calback_handler import PrintRetrievalHandler, StreamHandler
 from chat_profile import ChatProfileRoleEnum
 from document_retriever import configure_retriever
 from llm_provider import LLMProviderEnum
@@ -16,12 +21,16 @@ from llm_provider import LLMProviderEnum
 # Constants
 GPT_LLM_MODEL = "gpt-3.5-turbo"
 COMMAND_R_LLM_MODEL = "command-r"
+HISTORY_TOKEN_LIMIT = 1500
+SYSTEM_PROMPT = """Use the following pieces of context from the uploaded documents to answer the user's question. If the answer is not in the context, say that you don't know.
+
+Context:
+{context}"""
 
 # Properties
 uploaded_files = []
 api_key = ""
 result_retriever = None
-chain = None
 llm = None
 model_name = ""
 
@@ -29,6 +38,55 @@ model_name = ""
 if "sidebar_state" not in st.session_state:
     st.session_state.sidebar_state = "expanded"
 
+
+def submit_to_executor(func, *args, **kwargs):
+    """Run func on the session executor, with the Streamlit context attached
+    so cached functions keep working off the main thread."""
+    if "executor" not in st.session_state:
+        st.session_state.executor = ThreadPoolExecutor(max_workers=2)
+
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args, **kwargs)
+
+    return st.session_state.executor.submit(run)
+
+
+@st.cache_resource
+def get_http_client():
+    # One pooled HTTP/2 client for every OpenAI call in the process, so
+    # back-to-back requests multiplex over a warm TLS connection instead of
+    # paying a handshake each time.
+    return httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=60,
+    )
+
+
+@st.cache_resource
+def get_llm(provider, model, key):
+    # Construct once per process; reruns reuse the client (and its pooled
+    # HTTP connections and tokenizer) instead of rebuilding it per turn.
+    if provider == LLMProviderEnum.OPEN_AI:
+        return ChatOpenAI(
+            model=model,
+            api_key=key,
+            temperature=0,
+            streaming=True,
+            http_client=get_http_client(),
+        )
+    elif provider == LLMProviderEnum.COHERE:
+        return ChatCohere(
+            model=model,
+            temperature=0.3,
+            streaming=True,
+            cohere_api_key=key,
+        )
+    return None
+
 # Streamlit app configuration
 st.set_page_config(
     page_title="InkChatGPT: Chat with Documents",
@@ -107,51 +165,44 @@ if selected_model and len(api_key.strip()) == 0:
         f"🔑 API key for {selected_model} is missing or invalid. Please provide a valid API key."
     )
 
-# Process uploaded files
+# Process uploaded files in a background thread, so the widget layer stays
+# responsive while documents are split and embedded.
 if uploaded_files:
-    result_retriever = configure_retriever(uploaded_files, cohere_api_key=api_key)
-
-    if result_retriever is not None:
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            chat_memory=msgs,
-            return_messages=True,
+    files_key = tuple(
+        hashlib.sha256(file.getvalue()).hexdigest() for file in uploaded_files
+    )
+    if st.session_state.get("retriever_files_key") != files_key:
+        st.session_state.retriever_files_key = files_key
+        st.session_state.retriever_future = submit_to_executor(
+            configure_retriever, uploaded_files, cohere_api_key=api_key
         )
 
-        if selected_model == LLMProviderEnum.OPEN_AI:
-            llm = ChatOpenAI(
-                model=model_name,
-                api_key=api_key,
-                temperature=0,
-                streaming=True,
-            )
-        elif selected_model == LLMProviderEnum.COHERE:
-            llm = ChatCohere(
-                model=model_name,
-                temperature=0.3,
-                streaming=True,
-                cohere_api_key=api_key,
-            )
+    if not st.session_state.retriever_future.done():
+        with st.status("Processing documents...", expanded=True):
+            st.write("Splitting and embedding your documents. Please wait...")
+            time.sleep(0.5)
+        st.rerun()
+
+    result_retriever = st.session_state.retriever_future.result()
+
+    if result_retriever is not None:
+        llm = get_llm(selected_model, model_name, api_key)
 
         if llm is None:
             st.error(
                 "Failed to initialize the language model. Please check your configuration."
             )
 
-        # Create the ConversationalRetrievalChain instance using the llm instance
-        chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            retriever=result_retriever,
-            memory=memory,
-            verbose=True,
-            max_tokens_limit=4000,
-        )
-
-        avatars = {
-            ChatProfileRoleEnum.HUMAN.value: "user",
-            ChatProfileRoleEnum.AI.value: "assistant",
-        }
+# Render the accumulated history exactly once per run, before the input box.
+# The response block below emits only the new turn, so old messages are not
+# re-written while a turn is in flight.
+if llm is not None:
+    avatars = {
+        ChatProfileRoleEnum.HUMAN.value: "user",
+        ChatProfileRoleEnum.AI.value: "assistant",
+    }
 
+    with st.container():
         for msg in msgs.messages:
             st.chat_message(avatars[msg.type]).write(msg.content)
 
@@ -162,13 +213,44 @@ if user_query := st.chat_input(
 ):
     st.chat_message("user").write(user_query)
 
+    # Retrieve with the raw query and answer with a single streamed LLM call.
+    # ConversationalRetrievalChain would first spend a second LLM round-trip
+    # rewriting the question into a standalone query; skipping that condense
+    # step halves per-turn LLM latency for document chat.
     with st.chat_message("assistant"):
-        retrieval_handler = PrintRetrievalHandler(st.empty())
-        stream_handler = StreamHandler(st.empty())
-        response = chain.run(
-            user_query,
-            callbacks=[retrieval_handler, stream_handler],
+        retrieval_status = st.empty()
+        retrieval_status.status("**Thinking...**").write(
+            f"**Checking document for query:** `{user_query}`. Please wait..."
+        )
+        relevant_docs = result_retriever.invoke(user_query)
+        retrieval_status.empty()
+
+        context = "\n\n".join(doc.page_content for doc in relevant_docs)
+
+        # Unbounded history would resend every prior token each turn; keep
+        # only the most recent turns that fit the token window, so per-turn
+        # prompt size (and latency and cost) stays bounded over a session.
+        history = trim_messages(
+            msgs.messages,
+            token_counter=llm,
+            max_tokens=HISTORY_TOKEN_LIMIT,
+            strategy="last",
+            start_on="human",
         )
 
+        messages = [
+            SystemMessage(content=SYSTEM_PROMPT.format(context=context)),
+            *history,
+            HumanMessage(content=user_query),
+        ]
+        # Streamlit's native streaming writer renders tokens as they arrive
+        # and returns the full text when the stream ends.
+        response = st.write_stream(
+            chunk.content for chunk in llm.stream(messages)
+        )
+
+    msgs.add_user_message(user_query)
+    msgs.add_ai_message(response)
+
 if selected_model and model_name:
     st.sidebar.caption(f"🪄 Using `{model_name}` model")
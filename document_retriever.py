@@ -1,56 +1,212 @@
+import hashlib
 import os
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import pypdfium2 as pdfium
 import streamlit as st
+import torch
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain.retrievers.document_compressors import EmbeddingsFilter
 from langchain_cohere import CohereRerank
+from langchain_core.documents import Document
 
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader, TextLoader
+from langchain_community.document_loaders import Docx2txtLoader
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import DocArrayInMemorySearch
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from vector_search import InMemoryVectorSearch
+
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
 RERANK_MODEL = "rerank-english-v2.0"
+SPLIT_BUFFER_SIZE = 32
+CHUNK_SIZE_TOKENS = 500
+CHUNK_OVERLAP_TOKENS = 50
+MAX_LOAD_WORKERS = 4
+
+# PDFium is not thread-safe: concurrent calls from the load workers can
+# crash the whole process. Every pdfium operation must hold this lock.
+_pdfium_lock = threading.Lock()
+INDEX_DIR = ".index"
 
 
-@st.cache_resource(ttl="1h")
-def configure_retriever(files, cohere_api_key, use_compression=False):
-    # Read documents
-    docs = []
-    temp_dir = tempfile.TemporaryDirectory()
+@st.cache_resource
+def get_text_splitter():
+    # Token-aware splitting sizes chunks against the model's token budget
+    # rather than raw characters; cache it so the tiktoken encoder loads once.
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name="cl100k_base",
+        chunk_size=CHUNK_SIZE_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+    )
+
+
+@st.cache_resource
+def get_embeddings(model_name):
+    # Construct once per process: loading the sentence-transformers weights
+    # is expensive and every script rerun would otherwise repeat it.
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE},
+    )
+
+
+def _index_path(files, embedding_model):
+    # Key the on-disk index by the embedding model and the uploaded bytes, so
+    # identical uploads reload instantly and model changes never mix indexes.
+    digest = hashlib.sha256(embedding_model.encode())
     for file in files:
-        temp_filepath = os.path.join(temp_dir.name, file.name)
-        with open(temp_filepath, "wb") as f:
-            f.write(file.getvalue())
-
-        _, extension = os.path.splitext(temp_filepath)
-
-        # Load the file using the appropriate loader
-        if extension == ".pdf":
-            loader = PyPDFLoader(temp_filepath)
-        elif extension == ".docx":
-            loader = Docx2txtLoader(temp_filepath)
-        elif extension == ".txt":
-            loader = TextLoader(temp_filepath)
+        digest.update(file.getvalue())
+    return os.path.join(INDEX_DIR, digest.hexdigest())
+
+
+# Key the cache on the file contents (not the upload widget identity), so
+# re-uploading the same document — in a later session or by another user of
+# this process — reuses the already-built index instead of re-embedding it.
+@st.cache_resource(
+    ttl="1h",
+    hash_funcs={UploadedFile: lambda file: hashlib.sha256(file.getvalue()).hexdigest()},
+)
+def configure_retriever(
+    files, cohere_api_key, use_compression=False, embedding_model=EMBEDDING_MODEL
+):
+    # Create embeddings. All chunks are embedded in a single embed_documents
+    # call; a larger encode batch keeps the model fed instead of paying
+    # per-chunk dispatch overhead.
+    embeddings = get_embeddings(embedding_model)
+
+    # Reload a previously built index for the same files, skipping the
+    # load/split/embed pipeline entirely on repeat uploads.
+    index_path = _index_path(files, embedding_model)
+    if os.path.isdir(index_path):
+        try:
+            vectordb = InMemoryVectorSearch.load_local(index_path, embeddings)
+        except (OSError, ValueError):
+            # An unreadable or partially written index (e.g. from before
+            # saves became atomic) should be rebuilt, not fatal.
+            pass
         else:
+            return _build_retriever(
+                vectordb, embeddings, cohere_api_key, use_compression
+            )
+
+    # Read and split files concurrently: parsing is per-file independent, so
+    # a small thread pool overlaps parsing across uploads.
+    text_splitter = get_text_splitter()
+    with ThreadPoolExecutor(max_workers=min(len(files), MAX_LOAD_WORKERS)) as executor:
+        results = list(
+            executor.map(
+                lambda file: _load_and_split(file, text_splitter),
+                files,
+            )
+        )
+
+    splits = []
+    for result in results:
+        if result is None:
             st.write("This document format is not supported!")
             return None
+        splits.extend(result)
+
+    # Drop duplicate chunks (repeated headers/footers/TOC fragments) before
+    # embedding, so each distinct text is embedded and indexed only once.
+    seen = set()
+    unique_splits = []
+    for split in splits:
+        content_hash = hashlib.blake2b(
+            split.page_content.encode(), digest_size=16
+        ).digest()
+        if content_hash not in seen:
+            seen.add(content_hash)
+            unique_splits.append(split)
+
+    # A scanned/image-only PDF extracts no text at all; tell the user
+    # instead of building (and persisting) an empty, unanswerable index.
+    if not unique_splits:
+        st.write("No text could be extracted from the uploaded document(s)!")
+        return None
+
+    # Store in vectordb and persist for reuse across sessions
+    vectordb = InMemoryVectorSearch.from_documents(unique_splits, embeddings)
+    vectordb.save_local(index_path)
+
+    return _build_retriever(vectordb, embeddings, cohere_api_key, use_compression)
+
+
+def _iter_documents(file):
+    """Yield Documents for one uploaded file, parsing straight from the
+    in-memory bytes. Only DOCX needs a temp file, because Docx2txtLoader
+    accepts nothing but a filesystem path."""
+    _, extension = os.path.splitext(file.name)
+
+    if extension == ".pdf":
+        # pdfium does the page parsing and text extraction in native code,
+        # several times faster than pure-Python pypdf on large documents.
+        # The lock is taken per page rather than per document, so extraction
+        # stays serialized (pdfium requirement) while splitting and other
+        # file types still overlap across the worker pool.
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(file.getvalue())
+            page_count = len(pdf)
+        try:
+            for page_number in range(page_count):
+                with _pdfium_lock:
+                    page = pdf[page_number]
+                    textpage = page.get_textpage()
+                    text = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                yield Document(
+                    page_content=text,
+                    metadata={"source": file.name, "page": page_number},
+                )
+        finally:
+            with _pdfium_lock:
+                pdf.close()
+    elif extension == ".docx":
+        with tempfile.NamedTemporaryFile(suffix=".docx") as temp_file:
+            temp_file.write(file.getbuffer())
+            temp_file.flush()
+            yield from Docx2txtLoader(temp_file.name).lazy_load()
+    elif extension == ".txt":
+        text = file.getvalue().decode("utf-8", errors="ignore")
+        yield Document(page_content=text, metadata={"source": file.name})
+
+
+def _load_and_split(file, text_splitter):
+    """Load one uploaded file and return its chunks, or None if unsupported.
+
+    Pages are consumed one at a time, so peak memory stays bounded by the
+    buffer size instead of the whole document materializing before splitting.
+    """
+    _, extension = os.path.splitext(file.name)
+    if extension not in (".pdf", ".docx", ".txt"):
+        return None
+
+    splits = []
+    buffer = []
+    for doc in _iter_documents(file):
+        buffer.append(doc)
+        if len(buffer) >= SPLIT_BUFFER_SIZE:
+            splits.extend(text_splitter.split_documents(buffer))
+            buffer.clear()
 
-        docs.extend(loader.load())
+    if buffer:
+        splits.extend(text_splitter.split_documents(buffer))
 
-    # Split documents
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
-    splits = text_splitter.split_documents(docs)
+    return splits
 
-    # Create embeddings and store in vectordb
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    vectordb = DocArrayInMemorySearch.from_documents(splits, embeddings)
 
-    # Define retriever
+def _build_retriever(vectordb, embeddings, cohere_api_key, use_compression):
+    # Define retriever. k caps the candidates handed to the LLM; fetch_k
+    # bounds how many the MMR pass scores, keeping query cost fixed as the
+    # index grows.
     retriever = vectordb.as_retriever(
-        search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4}
+        search_type="mmr", search_kwargs={"k": 4, "fetch_k": 8}
     )
 
     if not use_compression:
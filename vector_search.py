@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class InMemoryVectorSearch(VectorStore):
+    """A minimal in-process vector store backed by a NumPy matrix.
+
+    Documents live in a Python list and their vectors in one contiguous
+    float32 array, so a query is a single BLAS matrix-vector product with no
+    index build, no per-add serialization, and no database on the hot path.
+    For the few thousand chunks a document chat holds, exact brute-force
+    search is both faster and simpler than a graph index.
+    """
+
+    def __init__(self, embedding):
+        self._embedding = embedding
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._documents = []
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            # Embedding an empty batch would collapse _vectors to a 1-D
+            # array and break the (n, d) shape every search relies on.
+            return []
+        metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+        vectors = _normalize(
+            np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        )
+
+        start = len(self._documents)
+        for text, metadata in zip(texts, metadatas):
+            self._documents.append(Document(page_content=text, metadata=metadata))
+
+        if self._vectors.size:
+            self._vectors = np.vstack([self._vectors, vectors])
+        else:
+            self._vectors = vectors
+
+        return [str(i) for i in range(start, len(self._documents))]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas)
+        return store
+
+    def _similarity_scores(self, query_vector):
+        # Stored vectors are L2-normalized at insert time, so cosine
+        # similarity reduces to one plain matrix-vector product. float32
+        # keeps it on the BLAS fast path; NumPy has no accelerated float16
+        # kernels.
+        return self._vectors @ _normalize(query_vector)
+
+    def _top_indices(self, scores, k):
+        # argpartition finds the k winners in O(n); only those are sorted.
+        k = min(k, len(self._documents))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        if not self._documents:
+            return []
+        query_vector = np.asarray(self._embedding.embed_query(query), dtype=np.float32)
+        scores = self._similarity_scores(query_vector)
+        top = self._top_indices(scores, k)
+        return [(self._documents[i], float(scores[i])) for i in top]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def max_marginal_relevance_search(
+        self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs
+    ):
+        if not self._documents:
+            return []
+        query_vector = np.asarray(self._embedding.embed_query(query), dtype=np.float32)
+        scores = self._similarity_scores(query_vector)
+        candidates = self._top_indices(scores, fetch_k)
+        selected = maximal_marginal_relevance(
+            query_vector, self._vectors[candidates], lambda_mult=lambda_mult, k=k
+        )
+        return [self._documents[candidates[i]] for i in selected]
+
+    def save_local(self, path):
+        # Write into a scratch directory and rename it into place, so a
+        # crash mid-save never leaves a partial directory where load_local
+        # expects a complete index.
+        parent = os.path.dirname(path) or "."
+        os.makedirs(parent, exist_ok=True)
+        scratch = tempfile.mkdtemp(dir=parent)
+        try:
+            np.save(os.path.join(scratch, "vectors.npy"), self._vectors)
+            records = [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in self._documents
+            ]
+            with open(os.path.join(scratch, "documents.json"), "w") as f:
+                json.dump(records, f)
+
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(scratch, path)
+        finally:
+            if os.path.isdir(scratch):
+                shutil.rmtree(scratch)
+
+    @classmethod
+    def load_local(cls, path, embedding):
+        store = cls(embedding)
+        # Normalizing here too keeps indexes persisted before normalization
+        # was introduced valid; it is a no-op for already-normalized rows.
+        store._vectors = _normalize(np.load(os.path.join(path, "vectors.npy")))
+        with open(os.path.join(path, "documents.json")) as f:
+            store._documents = [
+                Document(
+                    page_content=record["page_content"],
+                    metadata=record["metadata"],
+                )
+                for record in json.load(f)
+            ]
+        return store